@@ -6,14 +6,15 @@ from dotenv import load_dotenv
 
 from examples.self_dev.self_dev_common import (
     MODEL_AGENTS,
-    FullRepoMessage,
+    full_repo_message,
+    llm_semaphore,
     mini_agents,
     SELF_DEV_OUTPUT,
     prompt_logger_agent,
     PROMPT_LOG_PATH_PREFIX,
 )
 from examples.self_dev.self_dev_prompts import SYSTEM_HERE_ARE_REPO_FILES
-from miniagents import miniagent, InteractionContext
+from miniagents import miniagent, InteractionContext, MiniAgent
 from miniagents.ext import dialog_loop, markdown_history_agent, console_user_agent
 from miniagents.ext.llm import SystemMessage
 
@@ -27,24 +28,39 @@ async def explainer_agent(ctx: InteractionContext) -> None:
     """
     prompt = [
         SystemMessage(SYSTEM_HERE_ARE_REPO_FILES),
-        FullRepoMessage(),
+        full_repo_message(),
         ctx.message_promises,
     ]
-    await prompt_logger_agent.inquire(prompt, history_md_file=f"{PROMPT_LOG_PATH_PREFIX}{ctx.this_agent.alias}.md")
 
     favourite_model = "claude-3-5-sonnet-20240620"
 
+    async def _reply_with_answer(_model_agent: MiniAgent) -> None:
+        # the favourite model waits for its turn too (it is still streamed to the user as soon as it is called)
+        async with llm_semaphore():
+            answer = _model_agent.inquire(prompt)
+            ctx.reply(answer)
+            await answer
+
+    async def _write_alt_answer(_model: str, _model_agent: MiniAgent) -> None:
+        async with llm_semaphore():
+            await markdown_history_agent.inquire(
+                _model_agent.inquire(prompt),
+                history_md_file=str(SELF_DEV_OUTPUT / f"ALT__{ctx.this_agent.alias}__{_model}.md"),
+                only_write=True,
+            )
+
+    # let's not "close" the agent's reply sequence until all the answers are written down
     for model, model_agent in MODEL_AGENTS.items():
         if model == favourite_model:
-            ctx.reply(model_agent.inquire(prompt))
+            ctx.wait_for(_reply_with_answer(model_agent))
         else:
-            ctx.wait_for(  # let's not "close" the agent's reply sequence until the [sub]agent below finishes too
-                markdown_history_agent.inquire(
-                    model_agent.inquire(prompt),
-                    history_md_file=str(SELF_DEV_OUTPUT / f"ALT__{ctx.this_agent.alias}__{model}.md"),
-                    only_write=True,
-                )
-            )
+            ctx.wait_for(_write_alt_answer(model, model_agent))
+
+    # the prompt is logged in parallel with the models being inquired (the agent doesn't have to wait for the log to be
+    # written before it starts replying)
+    ctx.wait_for(
+        prompt_logger_agent.inquire(prompt, history_md_file=f"{PROMPT_LOG_PATH_PREFIX}{ctx.this_agent.alias}.md")
+    )
 
 
 async def main() -> None:
@@ -9,14 +9,15 @@ from dotenv import load_dotenv
 from examples.self_dev.self_dev_common import (
     MINIAGENTS_ROOT,
     MODEL_AGENTS,
-    FullRepoMessage,
+    full_repo_message,
+    llm_semaphore,
     mini_agents,
     SELF_DEV_OUTPUT,
     prompt_logger_agent,
     PROMPT_LOG_PATH_PREFIX,
 )
 from examples.self_dev.self_dev_prompts import SYSTEM_HERE_ARE_REPO_FILES, SYSTEM_IMPROVE_README
-from miniagents import miniagent, InteractionContext, StreamAppender, Message, MessageSequencePromise
+from miniagents import miniagent, InteractionContext, StreamAppender, Message, MiniAgent
 from miniagents.ext import file_agent, dialog_loop, markdown_history_agent, console_user_agent
 from miniagents.ext.llm import SystemMessage
 
@@ -31,7 +32,7 @@ async def readme_agent(ctx: InteractionContext) -> None:
     """
     prompt = [
         SystemMessage(SYSTEM_HERE_ARE_REPO_FILES),
-        FullRepoMessage(),
+        full_repo_message(),
         SystemMessage(SYSTEM_IMPROVE_README),
         ctx.message_promises,
     ]
@@ -40,23 +41,22 @@ async def readme_agent(ctx: InteractionContext) -> None:
     token_appender = StreamAppender[str]()
     ctx.reply(Message.promise(message_token_streamer=token_appender))
 
-    async def _report_file_written(_md_file_name: str, _model_response: MessageSequencePromise) -> None:
-        await _model_response
+    async def _write_readme_variant(_md_file_name: str, _model_agent: MiniAgent) -> None:
+        # only a limited number of models are called at the same time (the rest wait for their turn)
+        async with llm_semaphore():
+            await file_agent.inquire(
+                _model_agent.inquire(prompt),
+                file=str(MINIAGENTS_ROOT / _md_file_name),
+            )
         token_appender.append(f"{_md_file_name}\n")
 
     with token_appender:
         token_appender.append(f"Generating {len(MODEL_AGENTS)} variants of README.md\n\n")
 
         report_tasks = []
-        # start all model agents in parallel
+        # start all model agents in parallel (but no more than `llm_semaphore()` allows at the same time)
         for model, model_agent in MODEL_AGENTS.items():
-            md_file_name = f"README__{model}.md"
-
-            model_response = file_agent.inquire(
-                model_agent.inquire(prompt),
-                file=str(MINIAGENTS_ROOT / md_file_name),
-            )
-            report_tasks.append(mini_agents.start_asap(_report_file_written(md_file_name, model_response)))
+            report_tasks.append(mini_agents.start_asap(_write_readme_variant(f"README__{model}.md", model_agent)))
 
         # TODO Oleksandr: instead of having to "gather" these tasks, make sure all spawned tasks are awaited before the
         #  agent exits ? no, that would be a disaster, you need something else
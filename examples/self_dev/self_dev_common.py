@@ -2,18 +2,40 @@
 This module contains common `self_def` code.
 """
 
+import asyncio
+import os
 from pathlib import Path
+from typing import Optional, Union
+from weakref import WeakKeyDictionary
 
 from dotenv import load_dotenv
 
 from miniagents import MiniAgents, Message
 from miniagents.ext import markdown_history_agent
 from miniagents.ext.llm.anthropic import anthropic_agent
+from miniagents.ext.llm.llm_common import LLMResponseCache
 from miniagents.ext.llm.openai import openai_agent
 
 load_dotenv()
 
+SELF_DEV_ROOT = Path(__file__).parent
+MINIAGENTS_ROOT = SELF_DEV_ROOT.parent.parent
+
+SELF_DEV_OUTPUT = SELF_DEV_ROOT / "output"
+SELF_DEV_PROMPTS = SELF_DEV_ROOT / "self_dev_prompts.py"
+SELF_DEV_TRANSIENT = SELF_DEV_ROOT / "transient"
+
 MAX_OUTPUT_TOKENS = 4096
+# bigger files (most likely generated ones) are not included into FullRepoMessage, so they don't blow up the prompt
+MAX_REPO_FILE_BYTES = 256 * 1024
+# how many LLM calls may be in flight at the same time across all the self_dev agents that run in the same event
+# loop (answers of the previous turns that are still being written down count too) - see `llm_semaphore()` (can be
+# overridden with the MINIAGENTS_LLM_CONCURRENCY environment variable)
+LLM_CONCURRENCY = int(os.getenv("MINIAGENTS_LLM_CONCURRENCY", "4"))
+# the models are asked at temperature 0, so if exactly the same prompt is sent to the same model again (for ex. when
+# an agent is re-run while the repo hasn't changed), the previous response is reused (delete the directory to start
+# from scratch)
+LLM_RESPONSE_CACHE = LLMResponseCache(SELF_DEV_TRANSIENT / "llm_cache")
 
 MODEL_AGENT_FACTORIES = {
     "gpt-4o-2024-05-13": openai_agent.fork(temperature=0),
@@ -24,7 +46,12 @@ MODEL_AGENT_FACTORIES = {
     "claude-3-haiku-20240307": anthropic_agent.fork(max_tokens=MAX_OUTPUT_TOKENS, temperature=0),
 }
 MODEL_AGENTS = {
-    model: MODEL_AGENT_FACTORIES[model].fork(model=model)
+    model: MODEL_AGENT_FACTORIES[model].fork(
+        model=model,
+        response_cache=LLM_RESPONSE_CACHE,
+        # every self_dev prompt starts with the full repo, so let Anthropic cache it between the calls
+        **({"prompt_caching": True} if model.startswith("claude-") else {}),
+    )
     for model in [
         # let's use only two best models in our self_dev agents
         "gpt-4o-2024-05-13",
@@ -32,13 +59,6 @@ MODEL_AGENTS = {
     ]
 }
 
-SELF_DEV_ROOT = Path(__file__).parent
-MINIAGENTS_ROOT = SELF_DEV_ROOT.parent.parent
-
-SELF_DEV_OUTPUT = SELF_DEV_ROOT / "output"
-SELF_DEV_PROMPTS = SELF_DEV_ROOT / "self_dev_prompts.py"
-SELF_DEV_TRANSIENT = SELF_DEV_ROOT / "transient"
-
 PROMPT_LOG_PATH_PREFIX = str(SELF_DEV_TRANSIENT / "PROMPT__")
 
 mini_agents = MiniAgents()
@@ -65,39 +85,26 @@ class FullRepoMessage(Message):
 
     repo_files: tuple[RepoFileMessage, ...]
 
-    def __init__(self) -> None:
+    def __init__(self, repo_file_listing: Optional[list[tuple[str, Path, os.stat_result]]] = None) -> None:
         """
         Create a FullRepoMessage object that contains the full content of the MiniAgents repository. (Take a snapshot
-        of the files as they currently are, in other words.)
+        of the files as they currently are, in other words.) If `repo_file_listing` is given (in the format returned by
+        `_list_repo_files()`), exactly those files are read and the repository is not scanned again.
         """
-        miniagent_files = [
-            (relative_posix_path(file), file)
-            for file in MINIAGENTS_ROOT.rglob("*")
-            if file.is_file() and file.stat().st_size > 0
-        ]
-        miniagent_files = [
-            RepoFileMessage(file_posix_path=file_posix_path, text=file.read_text(encoding="utf-8"))
-            for file_posix_path, file in miniagent_files
-            if (
-                not any(
-                    file_posix_path.startswith(prefix)
-                    for prefix in [
-                        ".",
-                        "dist/",
-                        relative_posix_path(SELF_DEV_OUTPUT),
-                        # relative_posix_path(SELF_DEV_PROMPTS),  # TODO Oleksandr: skip the prompts file ?
-                        relative_posix_path(SELF_DEV_TRANSIENT),
-                        "htmlcov/",
-                        "images/",
-                        # "LICENSE",
-                        "venv/",
-                        "poetry.lock",
-                    ]
-                )
-                and not any(file_posix_path.endswith(suffix) for suffix in [".pyc"])
-            )
-        ]
-        miniagent_files.sort(key=lambda file_message: file_message.file_posix_path)
+        if repo_file_listing is None:
+            repo_file_listing = _list_repo_files()
+
+        miniagent_files = []
+        for file_posix_path, file, _ in repo_file_listing:
+            try:
+                file_text = file.read_text(encoding="utf-8")
+            except UnicodeDecodeError:
+                # not a text file
+                continue
+            if "\0" in file_text:
+                # not a text file either (although it happens to be valid UTF-8)
+                continue
+            miniagent_files.append(RepoFileMessage(file_posix_path=file_posix_path, text=file_text))
         super().__init__(repo_files=miniagent_files)
 
     def _as_string(self) -> str:
@@ -106,8 +113,96 @@ class FullRepoMessage(Message):
         return f"<file_list>\n{file_list_str}\n</file_list>\n\n\n\n<files>\n{source_files_str}\n</files>"
 
 
+_llm_semaphores: "WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = WeakKeyDictionary()
+
+
+def llm_semaphore() -> asyncio.Semaphore:
+    """
+    Get the semaphore that limits how many LLM calls the self_dev agents make at the same time (see LLM_CONCURRENCY).
+    There is one semaphore per event loop, because in Python 3.9 a semaphore is bound to the loop it was first used in.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+        _llm_semaphores[loop] = semaphore
+    return semaphore
+
+
 def relative_posix_path(file: Path) -> str:
     """
     Get the path of a file as a POSIX path relative to the MiniAgents repository root.
     """
     return file.relative_to(MINIAGENTS_ROOT).as_posix()
+
+
+_full_repo_message_cache: dict[tuple[tuple[str, int, int], ...], FullRepoMessage] = {}
+
+
+def full_repo_message() -> FullRepoMessage:
+    """
+    Get a FullRepoMessage with the current content of the MiniAgents repository. The same message is returned for as
+    long as no files are added, removed or modified in the repository (so the files are not read again on every turn
+    of a conversation).
+    """
+    repo_file_listing = _list_repo_files()
+    repo_files_signature = tuple(
+        (file_posix_path, file_stat.st_mtime_ns, file_stat.st_size)
+        for file_posix_path, _, file_stat in repo_file_listing
+    )
+    if repo_files_signature not in _full_repo_message_cache:
+        # only the latest snapshot is kept (it is built from the same listing the signature was made from, so the
+        # files are not scanned twice and the cached message contains exactly the files that the signature describes)
+        _full_repo_message_cache.clear()
+        _full_repo_message_cache[repo_files_signature] = FullRepoMessage(repo_file_listing)
+    return _full_repo_message_cache[repo_files_signature]
+
+
+def _list_repo_files() -> list[tuple[str, Path, os.stat_result]]:
+    """
+    List the files of the MiniAgents repository that should be a part of FullRepoMessage together with their stats
+    (sorted by their POSIX paths relative to the repository root).
+    """
+    excluded_prefixes = (
+        ".",
+        "dist/",
+        relative_posix_path(SELF_DEV_OUTPUT),
+        # relative_posix_path(SELF_DEV_PROMPTS),  # TODO Oleksandr: skip the prompts file ?
+        relative_posix_path(SELF_DEV_TRANSIENT),
+        "htmlcov/",
+        "images/",
+        # "LICENSE",
+        "venv/",
+        "poetry.lock",
+    )
+    miniagent_files = []
+    _scan_repo_dir(MINIAGENTS_ROOT, "", excluded_prefixes, miniagent_files)
+    miniagent_files.sort(key=lambda file_tuple: file_tuple[0])
+    return miniagent_files
+
+
+def _scan_repo_dir(
+    dir_path: Union[str, Path],
+    dir_posix_prefix: str,
+    excluded_prefixes: tuple[str, ...],
+    miniagent_files: list[tuple[str, Path, os.stat_result]],
+) -> None:
+    """
+    Collect the files of a repository directory recursively. The directories in which every file would be excluded
+    anyway (`.git`, `venv` etc.) are not descended into at all. Neither are symlinks to directories (just like with
+    `Path.rglob()`), so symlink loops and files outside the repository can't end up in the snapshot.
+    """
+    with os.scandir(dir_path) as dir_entries:
+        for dir_entry in dir_entries:
+            file_posix_path = f"{dir_posix_prefix}{dir_entry.name}"
+            if dir_entry.is_dir(follow_symlinks=False):
+                if not f"{file_posix_path}/".startswith(excluded_prefixes):
+                    _scan_repo_dir(dir_entry.path, f"{file_posix_path}/", excluded_prefixes, miniagent_files)
+            elif (
+                dir_entry.is_file()
+                and not file_posix_path.startswith(excluded_prefixes)
+                and not file_posix_path.endswith(".pyc")
+            ):
+                file_stat = dir_entry.stat()
+                if 0 < file_stat.st_size <= MAX_REPO_FILE_BYTES:
+                    miniagent_files.append((file_posix_path, Path(dir_entry.path), file_stat))
@@ -2,22 +2,30 @@
 This module provides agents working with chat history.
 """
 
-from dataclasses import dataclass
+import re
+from functools import cache
 from pathlib import Path
-from typing import Optional, Union
+from typing import Any, Optional, Union
 
 from markdown_it import MarkdownIt
+from markdown_it.rules_core import StateCore
 
 from miniagents.messages import Message
 from miniagents.miniagents import InteractionContext, miniagent
 
 
 @miniagent
-async def in_memory_history_agent(ctx: InteractionContext, message_list: list[Message]) -> None:
+async def in_memory_history_agent(
+    ctx: InteractionContext, message_list: list[Message], max_messages: Optional[int] = None
+) -> None:
     """
-    TODO Oleksandr: docstring
+    An agent that appends the messages it receives (`ctx.message_promises`) to the `message_list` and returns all the
+    messages from the list as a reply. If `max_messages` is set, only that many of the most recent messages are kept
+    in the list (the older ones are forgotten, so the history doesn't grow without bound in long conversations).
     """
     message_list.extend(await ctx.message_promises)
+    if max_messages is not None and len(message_list) > max_messages:
+        del message_list[: len(message_list) - max_messages]
     ctx.reply(message_list)
 
 
@@ -36,119 +44,244 @@ async def markdown_history_agent(
     history_md_file = Path(history_md_file)
     history_md_file.parent.mkdir(parents=True, exist_ok=True)
 
-    # log the current messages to the chat history file
+    # log the current messages to the chat history file (if the full chat history needs to be returned afterwards,
+    # the file is opened for reading too, so it doesn't have to be opened again to read the chat history back)
     with history_md_file.open(
-        mode="a" if append else "w",
-        buffering=1,  # line buffering
+        mode=("a" if append else "w") + ("" if only_write else "+"),
+        buffering=_HISTORY_MD_BUFFER_SIZE,  # the file is flushed after every message rather than after every line
         encoding="utf-8",
     ) as chat_md_file:
         async for msg_promise in ctx.message_promises:
-            if getattr(msg_promise.preliminary_metadata, "no_history", False):
+            preliminary_metadata = msg_promise.preliminary_metadata
+            if getattr(preliminary_metadata, "no_history", False):
                 # do not log this message to the chat history
                 continue
 
-            try:
-                message_role = msg_promise.preliminary_metadata.role
-            except AttributeError:
-                message_role = default_role
-            try:
-                message_model = msg_promise.preliminary_metadata.model or ""
-            except AttributeError:
-                message_model = ""
+            message_role = getattr(preliminary_metadata, "role", default_role)
+            message_model = getattr(preliminary_metadata, "model", None)
 
             if message_model:
-                message_model = f" / {message_model}"
-
-            chat_md_file.write(f"\n{message_role}{message_model}\n========================================\n")
+                chat_md_file.write(f"\n{message_role} / {message_model}{_ROLE_HEADING_UNDERLINE}")
+            else:
+                chat_md_file.write(f"\n{message_role}{_ROLE_HEADING_UNDERLINE}")
 
             async for token in msg_promise:
                 chat_md_file.write(token)
             chat_md_file.write("\n")
+            chat_md_file.flush()
+
+        if not only_write:
+            chat_md_file.seek(0)
+            md_content = chat_md_file.read()
 
     if not only_write:
         # return the full chat history (including the messages that were already in the file before) as a reply
-        ctx.reply(_load_chat_history_md(history_md_file))
+        ctx.reply(_load_chat_history_md(history_md_file, md_content))
+
+
+_HISTORY_MD_BUFFER_SIZE = 65536
+# the role headings are written as setext headings (the line with the role is followed by this line)
+_ROLE_HEADING_UNDERLINE = "\n========================================\n"
+
+_NEWLINE = re.compile("\n")
+_NON_WHITESPACE = re.compile(r"\S")
+# a top level h1 heading is either a line that starts with `#` or a paragraph that is underlined with `=` (in both
+# cases the line may be indented with up to three spaces) - if there are no such lines, there are no role headings
+_POSSIBLE_H1_LINE = re.compile(r"^ {0,3}[#=]", re.MULTILINE)
+# the text of a role heading always starts with the role (either right after `#` or at the beginning of the line that
+# is underlined with `=`, possibly preceded by whitespaces) - no such lines means no role headings either
+_POSSIBLE_ROLE_HEADING_LINE = re.compile(
+    r"^[^\S\n]*(?:#[ \t][^\S\n]*)?(?:system|user|assistant)", re.IGNORECASE | re.MULTILINE
+)
+# the text of a role heading: the role, optionally followed by a slash and a model name without whitespaces
+_ROLE_HEADING = re.compile(r"\s*(system|user|assistant)\s*(?:/\s*(\S*))?\s*", re.IGNORECASE)
+_ROLES = ("system", "user", "assistant")
+# the key under which the chat history markdown parser puts the indices of the top level h1 headings into `env`
+_H1_HEADING_INDICES = "h1_heading_indices"
+
+# the most recently parsed chat histories keyed by the paths of their files: the markdown content, the messages and the
+# offsets at which the role headings of the messages start (messages are immutable, so it is safe to share them between
+# the callers)
+_parsed_chat_histories: dict[Path, tuple[str, tuple[Message, ...], tuple[int, ...]]] = {}
+_MAX_PARSED_CHAT_HISTORIES = 16
+
+
+def _load_chat_history_md(history_md_file: Path, md_content: Optional[str] = None) -> tuple[Message, ...]:
+    """
+    Load a markdown file as a dialog (if the caller already read the content of the file, it can be passed as
+    `md_content`, so the file is not read again). If the content of the file was already parsed before, the messages
+    are taken from the cache instead of tokenizing the markdown content again. If the file was only appended to since
+    the last time it was parsed, only the last message and the appended content are parsed.
+    """
+    if md_content is None:
+        md_content = history_md_file.read_text(encoding="utf-8")
+
+    cache_key = history_md_file.resolve()
+    # the chat history is put back into the cache at the end, so the ones that were not used for the longest time are
+    # the first ones to be forgotten
+    parsed_chat_history = _parsed_chat_histories.pop(cache_key, None)
+
+    if parsed_chat_history is None or not md_content.startswith(parsed_chat_history[0]):
+        messages, role_heading_offsets = _parse_chat_history_md(md_content)
+    elif len(md_content) == len(parsed_chat_history[0]):
+        _, messages, role_heading_offsets = parsed_chat_history
+    else:
+        messages, role_heading_offsets = _parse_appended_chat_history_md(md_content, *parsed_chat_history[1:])
 
+    if len(_parsed_chat_histories) >= _MAX_PARSED_CHAT_HISTORIES:
+        # forget the least recently used parsed chat history (dicts preserve insertion order)
+        del _parsed_chat_histories[next(iter(_parsed_chat_histories))]
+    _parsed_chat_histories[cache_key] = md_content, messages, role_heading_offsets
 
-_md = MarkdownIt()
+    return messages
 
 
-def _load_chat_history_md(history_md_file: Path) -> tuple[Message, ...]:
+def _parse_appended_chat_history_md(
+    md_content: str, prev_messages: tuple[Message, ...], prev_role_heading_offsets: tuple[int, ...]
+) -> tuple[tuple[Message, ...], tuple[int, ...]]:
     """
-    Parse a markdown content as a dialog.
-    TODO Oleksandr: implement exhaustive unit tests for this function
+    Parse a markdown content that was produced by appending more content to a markdown content that was already
+    parsed before (into `prev_messages`). A top level role heading can't be preceded by any unfinished markdown block,
+    so nothing that comes before the last role heading can be affected by appending more content - the content is
+    parsed starting from the last role heading (the last message may have received more content).
     """
-    md_content = history_md_file.read_text(encoding="utf-8")
+    if not prev_messages:
+        # there are no role headings to start from (the appended content may turn the content that was already there
+        # into role headings, for ex. by underlining it with `=`)
+        return _parse_chat_history_md(md_content)
 
-    md_lines = md_content.split("\n")
-    md_tokens = _md.parse(md_content)
+    reparse_offset = prev_role_heading_offsets[-1]
+    tail_messages, tail_role_heading_offsets = _parse_chat_history_md(md_content[reparse_offset:])
 
-    last_section = None
-    sections = []
+    if not tail_role_heading_offsets or tail_role_heading_offsets[0] != 0:
+        # the last role heading is not a role heading anymore (for ex. `# user` turned into `# users` or the `=`
+        # underline of a role heading was continued with some other characters) - the previous message needs to be
+        # extended, so it's simpler to parse everything again
+        return _parse_chat_history_md(md_content)
 
-    for idx, md_token in enumerate(md_tokens):
-        if md_token.type != "heading_open" or md_token.tag != "h1" or md_token.level != 0:
-            continue
+    return (
+        prev_messages[:-1] + tail_messages,
+        prev_role_heading_offsets[:-1] + tuple(reparse_offset + offset for offset in tail_role_heading_offsets),
+    )
 
-        heading = md_tokens[idx + 1].content  # the next token is `inline` with the heading content
-        heading_parts = heading.split("/", maxsplit=1)
-        role = heading_parts[0].strip().lower()
 
-        if role not in ["system", "user", "assistant"]:
+def _parse_chat_history_md(md_content: str) -> tuple[tuple[Message, ...], tuple[int, ...]]:
+    """
+    Parse a markdown content as a dialog. Apart from the messages, the offsets at which the role headings of the
+    messages start in the markdown content are returned.
+    TODO Oleksandr: implement exhaustive unit tests for this function
+    """
+    if not _POSSIBLE_H1_LINE.search(md_content) or not _POSSIBLE_ROLE_HEADING_LINE.search(md_content):
+        # no need to tokenize the markdown content if there isn't a single line that could be a role heading
+        return (), ()
+
+    line_starts = _index_line_starts(md_content)
+    md_env: dict[str, Any] = {}
+    md_tokens = _markdown_parser().parse(md_content, md_env)
+
+    # (role, model, heading line, content start line)
+    role_headings: list[tuple[str, Optional[str], int, int]] = []
+
+    # only the top level h1 headings can be role headings (the parser collects them while parsing)
+    for idx in md_env[_H1_HEADING_INDICES]:
+        md_token = md_tokens[idx]
+        # the next token is `inline` with the heading content
+        role_heading_match = _ROLE_HEADING.fullmatch(md_tokens[idx + 1].content)
+        if not role_heading_match:
+            # not a role heading (or the model name contains whitespaces, which means that this heading is probably
+            # not really a role heading either)
             continue
 
-        if len(heading_parts) > 1:
-            model = heading_parts[1].strip()
-            if any(c.isspace() for c in model):
-                # model name should not contain whitespaces - this heading is probably not really a role heading
-                continue
-        else:
-            model = None
+        role, model = role_heading_match.groups()
+        role = role.lower()
+        if role not in _ROLES:
+            # `re.IGNORECASE` is more lenient than `str.lower()` with some exotic unicode characters
+            continue
 
-        if last_section:
-            last_section.content = _grab_and_clean_up_lines(md_lines, last_section.content_start_line, md_token.map[0])
-            sections.append(last_section)
+        role_headings.append((role, model, md_token.map[0], md_token.map[1]))
 
-        last_section = _Section(role=role, model=model, content_start_line=md_token.map[1])
+    # every section ends where the next role heading starts (the last section ends where the content ends)
+    section_end_lines = [heading_line for _, _, heading_line, _ in role_headings[1:]]
+    section_end_lines.append(None)
 
-    if last_section:
-        last_section.content = _grab_and_clean_up_lines(md_lines, last_section.content_start_line)
-        sections.append(last_section)
+    messages = tuple(
+        Message(
+            role=role,
+            model=model,
+            text=_grab_and_clean_up_lines(md_content, line_starts, content_start_line, section_end_line),
+        )
+        for (role, model, _, content_start_line), section_end_line in zip(role_headings, section_end_lines)
+    )
+    return messages, tuple(line_starts[heading_line] for _, _, heading_line, _ in role_headings)
 
-    return tuple(Message(role=section.role, model=section.model, text=section.content) for section in sections)
+
+@cache
+def _markdown_parser() -> MarkdownIt:
+    """
+    Create the markdown parser for chat histories (only once, the first time it is needed). Only the block level
+    structure of the markdown content matters for chat histories (the content of the headings is taken from the
+    `inline` tokens as is), so the inline parsing stage is switched off (`text_join` only exists since markdown-it-py
+    3.0, so it is ignored if it is not there).
+    """
+    md_parser = MarkdownIt().disable(["inline", "text_join"], ignoreInvalid=True)
+    md_parser.core.ruler.after("block", "collect_h1_headings", _collect_h1_headings)
+    return md_parser
+
+
+def _collect_h1_headings(state: StateCore) -> None:
+    """
+    A core rule of the chat history markdown parser that runs right after the block level parsing and collects the
+    indices of the top level h1 `heading_open` tokens into the parsing environment. It spares the callers of the
+    parser from checking every token themselves.
+    """
+    state.env[_H1_HEADING_INDICES] = [
+        idx
+        for idx, md_token in enumerate(state.tokens)
+        if md_token.type == "heading_open" and md_token.tag == "h1" and md_token.level == 0
+    ]
 
 
-def _grab_and_clean_up_lines(md_lines: list[str], start_line: int, end_line: Optional[int] = None) -> str:
+def _index_line_starts(md_content: str) -> list[int]:
+    """
+    Find the offsets at which the lines of the markdown content start. One extra offset is added at the end (as if
+    there was one more line after the last one), so the line number `i` always ends at `line_starts[i + 1] - 1`.
+    """
+    # every line, except the first one, starts right after a newline (the newlines are found by the regex engine, so
+    # no substrings are created for the lines themselves, unlike with `str.split()`)
+    line_starts = [0]
+    line_starts.extend([newline_match.end() for newline_match in _NEWLINE.finditer(md_content)])
+    line_starts.append(len(md_content) + 1)
+    return line_starts
+
+
+def _grab_and_clean_up_lines(
+    md_content: str, line_starts: list[int], start_line: int, end_line: Optional[int] = None
+) -> str:
     """
     Grab a snippet of the markdown content by start and end line numbers and clean it up (remove leading
-    and trailing empty lines).
+    and trailing empty lines). The snippet is sliced out of the markdown content directly, without splitting
+    the content into lines.
     """
     if end_line is None:
-        end_line = len(md_lines)
-
-    content_lines = md_lines[start_line:end_line]
+        end_line = len(line_starts) - 1
 
-    # remove leading and trailing empty lines (but keep the leading and trailing whitespaces of the
+    # skip leading and trailing empty lines (but keep the leading and trailing whitespaces of the
     # non-empty lines)
-    while content_lines and not content_lines[0].strip():
-        content_lines.pop(0)
-    while content_lines and not content_lines[-1].strip():
-        content_lines.pop()
+    while start_line < end_line and _is_empty_line(md_content, line_starts, start_line):
+        start_line += 1
+    while end_line > start_line and _is_empty_line(md_content, line_starts, end_line - 1):
+        end_line -= 1
 
-    if not content_lines:
+    if start_line == end_line:
         # there is no content in this section
         return ""
 
-    return "\n".join(content_lines)
+    return md_content[line_starts[start_line] : line_starts[end_line] - 1]
 
 
-@dataclass
-class _Section:
+def _is_empty_line(md_content: str, line_starts: list[int], line_idx: int) -> bool:
     """
-    Represents a section of the markdown content.
+    Check if the line consists of whitespaces only. The line is scanned right inside the markdown content (no
+    substring is created for it). `\\S` means the same thing as "not `str.isspace()`" in Python regexes.
     """
-
-    role: str
-    model: Optional[str]
-    content_start_line: int
-    content: Optional[str] = None
+    return _NON_WHITESPACE.search(md_content, line_starts[line_idx], line_starts[line_idx + 1] - 1) is None
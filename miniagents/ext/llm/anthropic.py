@@ -7,9 +7,9 @@ import logging
 import typing
 from functools import cache
 from pprint import pformat
-from typing import AsyncIterator, Any, Optional
+from typing import AsyncIterator, Any, Optional, Union
 
-from miniagents.ext.llm.llm_common import message_to_llm_dict, AssistantMessage
+from miniagents.ext.llm.llm_common import message_to_llm_dict, AssistantMessage, LLMResponseCache, RateLimiter
 from miniagents.miniagents import miniagent, MiniAgents, InteractionContext
 
 if typing.TYPE_CHECKING:
@@ -33,11 +33,18 @@ async def anthropic_agent(
     fake_first_user_message: str = "/start",
     message_delimiter_for_same_role: str = "\n\n",
     async_client: Optional["anthropic_original.AsyncAnthropic"] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    response_cache: Optional[LLMResponseCache] = None,
+    prompt_caching: bool = False,
     reply_metadata: Optional[dict[str, Any]] = None,
     **kwargs,
 ) -> None:
     """
     An agent that represents Large Language Models by Anthropic.
+
+    If `prompt_caching` is True, Anthropic is asked to cache everything up to the message that precedes the newest one
+    (the system prompt and, for ex., a big document that is sent at the beginning of every conversation), so the next
+    requests that start with the same messages are processed faster and cheaper.
     """
     if not async_client:
         async_client = _default_anthropic_client()
@@ -47,6 +54,8 @@ async def anthropic_agent(
 
     async def message_token_streamer(metadata_so_far: dict[str, Any]) -> AsyncIterator[str]:
         message_dicts = [message_to_llm_dict(msg) for msg in await ctx.message_promises]
+        if prompt_caching:
+            _set_cache_breakpoint(message_dicts)
         message_dicts = _fix_message_dicts(
             message_dicts,
             fake_first_user_message=fake_first_user_message,
@@ -75,6 +84,27 @@ async def anthropic_agent(
                 "SENDING TO ANTHROPIC:\n\n%s\nSYSTEM:\n%s\n", pformat(message_dicts), pformat(system_combined)
             )
 
+        if response_cache:
+            cache_key = response_cache.make_key(
+                provider="anthropic",
+                model=model,
+                system=system_combined if isinstance(system_combined, str) else None,
+                messages=message_dicts,
+                **kwargs,
+            )
+            cached_response = response_cache.get(cache_key)
+            if cached_response:
+                cached_text, cached_metadata = cached_response
+                yield cached_text
+                metadata_so_far.update(cached_metadata)
+                return
+
+        if rate_limiter:
+            await rate_limiter.await_capacity(
+                [*message_dicts, {"content": system_combined}] if isinstance(system_combined, str) else message_dicts,
+                max_tokens=kwargs.get("max_tokens"),
+            )
+
         if stream:
             # pylint: disable=not-async-context-manager
             async with async_client.messages.stream(
@@ -94,7 +124,15 @@ async def anthropic_agent(
                 )
             yield anthropic_final_message.content[0].text  # yield the whole text as one "piece"
 
-        metadata_so_far.update(anthropic_final_message.model_dump(exclude={"content"}))
+        anthropic_metadata = anthropic_final_message.model_dump(exclude={"content"})
+        metadata_so_far.update(anthropic_metadata)
+
+        if response_cache:
+            response_cache.put(
+                cache_key,
+                "".join(block.text for block in anthropic_final_message.content if block.type == "text"),
+                anthropic_metadata,
+            )
 
     ctx.reply(
         AnthropicMessage.promise(
@@ -142,8 +180,43 @@ def _fix_message_dicts(
     # if multiple messages with the same role are sent in a row, they should be concatenated
     for message_dict in message_dicts:
         if fixed_message_dicts and message_dict["role"] == fixed_message_dicts[-1]["role"]:
-            fixed_message_dicts[-1]["content"] += message_delimiter_for_same_role + message_dict["content"]
+            prev_content = fixed_message_dicts[-1]["content"]
+            content = message_dict["content"]
+            if isinstance(prev_content, str) and isinstance(content, str):
+                fixed_message_dicts[-1]["content"] = prev_content + message_delimiter_for_same_role + content
+            else:
+                # at least one of the messages is a list of content blocks (the one with a cache breakpoint) - the
+                # blocks can't be merged into one string without losing the breakpoint, so they are kept separate
+                first_block, *other_blocks = _as_content_blocks(content)
+                fixed_message_dicts[-1]["content"] = [
+                    *_as_content_blocks(prev_content),
+                    {**first_block, "text": message_delimiter_for_same_role + first_block["text"]},
+                    *other_blocks,
+                ]
         else:
             fixed_message_dicts.append(message_dict)
 
     return fixed_message_dicts
+
+
+def _set_cache_breakpoint(message_dicts: list[dict[str, Any]]) -> None:
+    """
+    Mark the second to last non-system message as a prompt cache breakpoint, so everything but the newest message is
+    cached. The system messages are not taken into account, because they are moved into the `system` parameter, which
+    is a part of the cached prefix anyway.
+    """
+    non_system_message_dicts = [message_dict for message_dict in message_dicts if message_dict["role"] != "system"]
+    if len(non_system_message_dicts) < 2:
+        # there is nothing before the newest message to cache
+        return
+
+    message_dict = non_system_message_dicts[-2]
+    message_dict["content"] = [
+        {"type": "text", "text": message_dict["content"], "cache_control": {"type": "ephemeral"}}
+    ]
+
+
+def _as_content_blocks(content: Union[str, list[dict[str, Any]]]) -> list[dict[str, Any]]:
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}]
+    return content
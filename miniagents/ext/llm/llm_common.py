@@ -2,7 +2,14 @@
 Common classes and functions for working with large language models.
 """
 
-from typing import Any, Optional
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Iterable, Optional, Union
 
 from miniagents.messages import Message
 
@@ -46,3 +53,98 @@ def message_to_llm_dict(message: Message) -> dict[str, Any]:
         "role": role,
         "content": str(message),
     }
+
+
+class RateLimiter:
+    """
+    Paces the requests to an LLM provider so that they stay within the requests-per-minute and tokens-per-minute
+    limits of the provider (instead of running into "429 Too Many Requests" errors and retrying blindly). Every
+    limit behaves like a bucket that holds a minute's worth of capacity and refills continuously, so short bursts are
+    let through right away. The same RateLimiter object should be shared by all the agents that use the same limits
+    (e.g. `openai_agent.fork(rate_limiter=RateLimiter(requests_per_minute=500, tokens_per_minute=30000))`).
+    """
+
+    # a rough estimate that is good enough for pacing (the actual number depends on the tokenizer and the language)
+    chars_per_token = 4
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # the moments (on the monotonic clock) at which the buckets will be full again if nothing else is reserved
+        self._requests_full_at = 0.0
+        self._tokens_full_at = 0.0
+
+    async def await_capacity(self, message_dicts: Iterable[dict[str, Any]], max_tokens: Optional[int] = None) -> None:
+        """
+        Wait until there is enough capacity to send the messages (and to receive up to `max_tokens` in response,
+        because the providers count those tokens against the limits too) and reserve that capacity.
+        """
+        chars = 0
+        for message_dict in message_dicts:
+            content = message_dict["content"]
+            if isinstance(content, str):
+                chars += len(content)
+            else:
+                # a list of content blocks
+                chars += sum(len(block.get("text", "")) for block in content)
+        tokens = chars // self.chars_per_token
+        delay = self._reserve(time.monotonic(), tokens + (max_tokens or 0))
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _reserve(self, now: float, tokens: int) -> float:
+        # NOTE: there is no `await` between checking the buckets and reserving the capacity, so no lock is needed
+        delay = 0.0
+        if self.requests_per_minute:
+            self._requests_full_at = max(self._requests_full_at, now) + 60 / self.requests_per_minute
+            delay = max(delay, self._requests_full_at - 60 - now)
+        if self.tokens_per_minute:
+            self._tokens_full_at = max(self._tokens_full_at, now) + 60 * tokens / self.tokens_per_minute
+            delay = max(delay, self._tokens_full_at - 60 - now)
+        return delay
+
+
+class LLMResponseCache:
+    """
+    A persistent cache of LLM responses (one JSON file per response in `cache_dir`). If exactly the same request (the
+    same provider, model, messages and all the other parameters) is sent to the LLM again, the response is taken from
+    the cache instead of calling the LLM. This is useful while developing and re-running agents with the same prompts
+    over and over again. Only the responses that were received completely are cached.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path]) -> None:
+        self.cache_dir = Path(cache_dir)
+
+    @staticmethod
+    def make_key(**request: Any) -> str:
+        """
+        Calculate the cache key for an LLM request. Values that are not JSON serializable are represented with their
+        `str()`, which, at worst, leads to cache misses.
+        """
+        request_json = json.dumps(request, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(request_json.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[tuple[str, dict[str, Any]]]:
+        """
+        Get the text and the metadata of a cached response (None if there is no response cached under this key).
+        """
+        try:
+            cached_response = json.loads((self.cache_dir / f"{key}.json").read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        return cached_response["text"], cached_response["metadata"]
+
+    def put(self, key: str, text: str, metadata: dict[str, Any]) -> None:
+        """
+        Cache the text and the metadata of a response. The file is written under a temporary name first and then
+        renamed, so a response that is being written is never read half-written.
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=f"{key}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+                json.dump({"text": text, "metadata": metadata}, tmp_file, ensure_ascii=False, default=str)
+            os.replace(tmp_path, self.cache_dir / f"{key}.json")
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
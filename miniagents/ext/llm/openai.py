@@ -9,7 +9,7 @@ from functools import cache
 from pprint import pformat
 from typing import AsyncIterator, Any, Optional
 
-from miniagents.ext.llm.llm_common import message_to_llm_dict, AssistantMessage
+from miniagents.ext.llm.llm_common import message_to_llm_dict, AssistantMessage, LLMResponseCache, RateLimiter
 from miniagents.miniagents import (
     miniagent,
     MiniAgents,
@@ -36,6 +36,8 @@ async def openai_agent(
     system: Optional[str] = None,
     n: int = 1,
     async_client: Optional["openai_original.AsyncOpenAI"] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    response_cache: Optional[LLMResponseCache] = None,
     reply_metadata: Optional[dict[str, Any]] = None,
     **kwargs,
 ) -> None:
@@ -66,6 +68,21 @@ async def openai_agent(
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug("SENDING TO OPENAI:\n\n%s\n", pformat(message_dicts))
 
+        if response_cache:
+            cache_key = response_cache.make_key(provider="openai", model=model, messages=message_dicts, **kwargs)
+            cached_response = response_cache.get(cache_key)
+            if cached_response:
+                cached_text, cached_metadata = cached_response
+                yield cached_text
+                metadata_so_far.update(cached_metadata)
+                return
+
+        preliminary_metadata = dict(metadata_so_far)
+        response_pieces = []  # the pieces of the response are collected to be cached at the end
+
+        if rate_limiter:
+            await rate_limiter.await_capacity(message_dicts, max_tokens=kwargs.get("max_tokens"))
+
         openai_response = await async_client.chat.completions.create(
             messages=message_dicts, model=model, stream=stream, **kwargs
         )
@@ -78,6 +95,7 @@ async def openai_agent(
                     )
                 token = chunk.choices[0].delta.content
                 if token:
+                    response_pieces.append(token)
                     yield token
 
                 metadata_so_far["role"] = chunk.choices[0].delta.role or metadata_so_far["role"]
@@ -91,6 +109,7 @@ async def openai_agent(
                     f"exactly one Choice was expected from OpenAI, "
                     f"but {len(openai_response.choices)} were returned instead"
                 )
+            response_pieces.append(openai_response.choices[0].message.content)
             yield openai_response.choices[0].message.content  # yield the whole text as one "piece"
 
             metadata_so_far["role"] = openai_response.choices[0].message.role
@@ -100,6 +119,18 @@ async def openai_agent(
                 )
             )
 
+        if response_cache:
+            # only the metadata that came from OpenAI is cached (the preliminary metadata is set by the agent anyway)
+            response_cache.put(
+                cache_key,
+                "".join(response_pieces),
+                {
+                    key: value
+                    for key, value in metadata_so_far.items()
+                    if key not in preliminary_metadata or value is not preliminary_metadata[key]
+                },
+            )
+
     ctx.reply(
         OpenAIMessage.promise(
             start_asap=True,  # TODO Oleksandr: should this be customizable ?
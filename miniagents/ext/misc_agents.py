@@ -3,6 +3,9 @@ This module provides a user agent that reads user input from the console, writes
 track of the chat history using the provided ChatHistory object.
 """
 
+import asyncio
+import sys
+from functools import cache
 from pathlib import Path
 from typing import Union
 
@@ -46,11 +49,11 @@ async def console_prompt_agent(
             "\033[0m"
         )
 
-    user_input = await _prompt_session.prompt_async(
+    user_input = await _prompt_session().prompt_async(
         HTML("<user_utterance>USER: </user_utterance>"),
         multiline=True,
         key_bindings=_prompt_bindings,
-        lexer=_CustomPromptLexer(),
+        lexer=_prompt_lexer,
         style=_user_prompt_style,
     )
     # skip an extra line after the user input
@@ -79,21 +82,27 @@ async def console_echo_agent(
     # TODO Oleksandr: should MessageSequencePromise support `cancel()` operation
     #  (to interrupt whoever is producing it) ?
 
+    stdout_flusher = _StdoutFlusher()
+    style_start = f"\033[{assistant_style}m"
+
     async for msg_promise in ctx.message_promises:
-        if hide_system_messages and getattr(msg_promise.preliminary_metadata, "role", None) == "system":
+        preliminary_metadata = msg_promise.preliminary_metadata
+        if hide_system_messages and getattr(preliminary_metadata, "role", None) == "system":
             continue
 
         if mention_aliases:
-            try:
-                agent_alias = msg_promise.preliminary_metadata.agent_alias
-            except AttributeError:
-                agent_alias = getattr(msg_promise.preliminary_metadata, "role", default_role)
+            agent_alias = getattr(preliminary_metadata, "agent_alias", None)
+            if agent_alias is None:
+                agent_alias = getattr(preliminary_metadata, "role", default_role)
 
-            print(f"\033[{assistant_style}m{agent_alias.upper()}: \033[0m", end="", flush=True)
+            sys.stdout.write(f"{style_start}{agent_alias.upper()}: {_STYLE_RESET}")
+            stdout_flusher.flush_soon()
 
         async for token in msg_promise:
-            print(f"\033[{assistant_style}m{token}\033[0m", end="", flush=True)
-        print("\n")  # this produces a double newline after a single message
+            sys.stdout.write(f"{style_start}{token}{_STYLE_RESET}")
+            stdout_flusher.flush_soon()
+        # this produces a double newline after a single message (the message is fully flushed right away)
+        print("\n", flush=True)
 
 
 @miniagent
@@ -108,16 +117,54 @@ async def file_agent(ctx: InteractionContext, file: Union[str, Path]) -> None:
 
     with file.open(
         mode="w",
-        buffering=1,  # line buffering
+        # the tokens are written to the file in big chunks instead of line by line (the file is flushed when it is
+        # closed, after the last token)
+        buffering=_FILE_AGENT_BUFFER_SIZE,
         encoding="utf-8",
     ) as file_stream:
         async for token in ctx.message_promises.as_single_promise():
             file_stream.write(token)
 
 
+_STYLE_RESET = "\033[0m"
+_FILE_AGENT_BUFFER_SIZE = 65536
+
+
+class _StdoutFlusher:
+    """
+    Flushes stdout shortly after something was printed instead of flushing it after every token. The tokens that are
+    printed within that short period of time are written out together (the delay is too short to be noticed by
+    a human watching the tokens appear in the console).
+    """
+
+    def __init__(self, delay: float = 0.02) -> None:
+        self.delay = delay
+        self._flush_scheduled = False
+
+    def flush_soon(self) -> None:
+        """
+        Schedule a flush of stdout (unless it is already scheduled).
+        """
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_later(self.delay, self._flush)
+
+    def _flush(self) -> None:
+        self._flush_scheduled = False
+        sys.stdout.flush()
+
+
 _user_prompt_style = Style.from_dict({"user_utterance": "fg:ansibrightyellow bold"})
 
-_prompt_session = PromptSession()
+
+@cache
+def _prompt_session() -> PromptSession:
+    """
+    Create the prompt session (only once, the first time the user is prompted). Creating it at import time would
+    make importing this module touch the terminal, even if the console prompt is never used.
+    """
+    return PromptSession()
+
 
 _prompt_bindings = KeyBindings()
 
@@ -139,6 +186,11 @@ class _CustomPromptLexer(Lexer):
 
     def lex_document(self, document: Document):
         """
-        Lex the document.
+        Lex the document. The text of the document is split into lines only once (and not every time a line is
+        requested).
         """
-        return lambda i: [("class:user_utterance", document.text.split("\n")[i])]
+        lines = document.lines
+        return lambda i: [("class:user_utterance", lines[i])]
+
+
+_prompt_lexer = _CustomPromptLexer()
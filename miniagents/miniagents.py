@@ -47,10 +47,23 @@ class MiniAgents(PromisingContext):
             [on_persist_message] if callable(on_persist_message) else list(on_persist_message)
         )
 
-    def run(self, awaitable: Awaitable[Any]) -> Any:
+    def run(self, awaitable: Awaitable[Any], use_uvloop: bool = True) -> Any:
         """
-        Run an awaitable in the MiniAgents context. This method is blocking. It also creates a new event loop.
+        Run an awaitable in the MiniAgents context. This method is blocking. It also creates a new event loop (an
+        `uvloop` one, if `use_uvloop` is True and the `uvloop` package is installed in version 0.18 or newer).
         """
+        if use_uvloop:
+            try:
+                # pylint: disable=import-outside-toplevel
+                import uvloop
+            except ImportError:
+                pass
+            else:
+                # `uvloop.run()` only exists since uvloop 0.18 (older versions are often installed indirectly, for
+                # ex. by uvicorn, and then the standard event loop is used)
+                if hasattr(uvloop, "run"):
+                    return uvloop.run(self.arun(awaitable))
+
         return asyncio.run(self.arun(awaitable))
 
     async def arun(self, awaitable: Awaitable[Any]) -> Any:
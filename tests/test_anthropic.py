@@ -0,0 +1,91 @@
+"""
+Test how the messages are prepared for the Anthropic API (without calling the API).
+"""
+
+from miniagents.ext.llm.anthropic import _fix_message_dicts, _set_cache_breakpoint
+
+_CACHED_REPO_BLOCK = {"type": "text", "text": "REPO", "cache_control": {"type": "ephemeral"}}
+
+
+def _prepare(message_dicts: list[dict[str, str]]) -> list[dict]:
+    _set_cache_breakpoint(message_dicts)
+    return _fix_message_dicts(message_dicts, fake_first_user_message="/start", message_delimiter_for_same_role="\n\n")
+
+
+def test_cache_breakpoint_is_set_on_the_message_before_the_newest_one() -> None:
+    """
+    Assert that the system messages are skipped when the breakpoint is chosen and that the block with the breakpoint
+    is merged with the newest message of the same role as a separate content block.
+    """
+    assert _prepare(
+        [
+            {"role": "system", "content": "S1"},
+            {"role": "user", "content": "REPO"},
+            {"role": "system", "content": "S2"},
+            {"role": "user", "content": "Hi"},
+        ]
+    ) == [
+        {"role": "user", "content": [_CACHED_REPO_BLOCK, {"type": "text", "text": "\n\nHi"}]},
+        {"role": "system", "content": "S1\n\nS2"},
+    ]
+
+
+def test_cache_breakpoint_ignores_trailing_system_messages() -> None:
+    """
+    Assert that a system message at the end doesn't move the breakpoint onto the newest non-system message.
+    """
+    assert _prepare(
+        [
+            {"role": "user", "content": "REPO"},
+            {"role": "assistant", "content": "Hello"},
+            {"role": "user", "content": "Hi"},
+            {"role": "system", "content": "S"},
+        ]
+    ) == [
+        {"role": "user", "content": "REPO"},
+        {
+            "role": "assistant",
+            "content": [{"type": "text", "text": "Hello", "cache_control": {"type": "ephemeral"}}],
+        },
+        {"role": "user", "content": "Hi"},
+        {"role": "system", "content": "S"},
+    ]
+
+
+def test_merging_plain_string_with_content_blocks() -> None:
+    """
+    Assert that a plain string that comes before a message with content blocks (of the same role) is merged with
+    it as a separate block and that the delimiter is prepended to the text of the next block.
+    """
+    assert _fix_message_dicts(
+        [
+            {"role": "user", "content": "Hello"},
+            {"role": "user", "content": [_CACHED_REPO_BLOCK]},
+        ],
+        fake_first_user_message="/start",
+        message_delimiter_for_same_role="\n\n",
+    ) == [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "Hello"},
+                {"type": "text", "text": "\n\nREPO", "cache_control": {"type": "ephemeral"}},
+            ],
+        },
+    ]
+
+
+def test_no_cache_breakpoint_when_only_system_messages_precede_the_newest_one() -> None:
+    """
+    Assert that no breakpoint is set when there is nothing but system messages before the newest message.
+    """
+    assert _prepare(
+        [
+            {"role": "system", "content": "S1"},
+            {"role": "system", "content": "S2"},
+            {"role": "user", "content": "Hi"},
+        ]
+    ) == [
+        {"role": "user", "content": "Hi"},
+        {"role": "system", "content": "S1\n\nS2"},
+    ]
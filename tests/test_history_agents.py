@@ -0,0 +1,186 @@
+"""
+Test the agents that work with chat history.
+"""
+
+from pathlib import Path
+
+import pytest
+
+from miniagents import MiniAgents
+from miniagents.ext import in_memory_history_agent, markdown_history_agent
+
+
+async def _aload_history(history_md_file: Path) -> list[tuple[str, str, str]]:
+    async with MiniAgents():
+        messages = await markdown_history_agent.inquire(history_md_file=str(history_md_file))
+    return [(message.role, message.model, message.text) for message in messages]
+
+
+@pytest.mark.asyncio
+async def test_markdown_history_agent_parses_sections(tmp_path: Path) -> None:
+    """
+    Assert that `markdown_history_agent` splits the chat history file into messages by role headings (and leaves
+    everything else, including headings that are not role headings, as part of the messages).
+    """
+    history_md_file = tmp_path / "CHAT.md"
+    history_md_file.write_text(
+        "this line is not part of any message\n"
+        "\n"
+        "user\n"
+        "========================================\n"
+        "\n"
+        "\n"
+        "Hello!\n"
+        "  indented line  \n"
+        "\n"
+        "ASSISTANT / gpt-4o-2024-05-13\n"
+        "========================================\n"
+        "Hi!\n"
+        "\n"
+        "Not a role\n"
+        "==========\n"
+        "\n"
+        "assistant / model with spaces\n"
+        "========================================\n"
+        "\n"
+        "```\n"
+        "# user\n"
+        "```\n"
+        "\n"
+        "   \n"
+        "# system\n"
+        "\n"
+        "Be nice.\n"
+        "\n",
+        encoding="utf-8",
+    )
+
+    assert await _aload_history(history_md_file) == [
+        ("user", None, "Hello!\n  indented line  "),
+        (
+            "assistant",
+            "gpt-4o-2024-05-13",
+            "Hi!\n"
+            "\n"
+            "Not a role\n"
+            "==========\n"
+            "\n"
+            "assistant / model with spaces\n"
+            "========================================\n"
+            "\n"
+            "```\n"
+            "# user\n"
+            "```",
+        ),
+        ("system", None, "Be nice."),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_markdown_history_agent_empty_sections(tmp_path: Path) -> None:
+    """
+    Assert that sections without any content (or only with empty lines) produce messages with empty text.
+    """
+    history_md_file = tmp_path / "CHAT.md"
+    history_md_file.write_text("# user\n\n \n\t\n# assistant /\n", encoding="utf-8")
+
+    assert await _aload_history(history_md_file) == [
+        ("user", None, ""),
+        ("assistant", "", ""),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_markdown_history_agent_reuses_parsed_history(tmp_path: Path) -> None:
+    """
+    Assert that the same chat history content is not parsed twice, but that a changed content is parsed again.
+    """
+    history_md_file = tmp_path / "CHAT.md"
+    history_md_file.write_text("# user\n\nHello!\n", encoding="utf-8")
+
+    async with MiniAgents():
+        messages1 = await markdown_history_agent.inquire(history_md_file=str(history_md_file))
+        messages2 = await markdown_history_agent.inquire(history_md_file=str(history_md_file))
+        history_md_file.write_text("# user\n\nHello again!\n", encoding="utf-8")
+        messages3 = await markdown_history_agent.inquire(history_md_file=str(history_md_file))
+
+    assert messages1[0] is messages2[0]
+    assert messages3[0].text == "Hello again!"
+
+
+@pytest.mark.asyncio
+async def test_markdown_history_agent_without_role_headings(tmp_path: Path) -> None:
+    """
+    Assert that a chat history file without any top level h1 headings produces no messages.
+    """
+    history_md_file = tmp_path / "CHAT.md"
+    history_md_file.write_text("user\n\n    # assistant\n\n## user\n\n    ===\n", encoding="utf-8")
+
+    assert await _aload_history(history_md_file) == []
+
+
+@pytest.mark.asyncio
+async def test_markdown_history_agent_parses_appended_history(tmp_path: Path) -> None:
+    """
+    Assert that when the chat history file is appended to, the messages before the last one are reused and the rest
+    is parsed correctly (including the case when the appended content breaks the last role heading).
+    """
+    history_md_file = tmp_path / "CHAT.md"
+    history_md_file.write_text("# user\n\nHello!\n\n# assistant\n\nHi", encoding="utf-8")
+
+    async with MiniAgents():
+        messages1 = await markdown_history_agent.inquire(history_md_file=str(history_md_file))
+        with history_md_file.open("a", encoding="utf-8") as file:
+            file.write("!\n\n# user\n\nBye!\n")
+        messages2 = await markdown_history_agent.inquire(history_md_file=str(history_md_file))
+        with history_md_file.open("a", encoding="utf-8") as file:
+            file.write("\nassistant\n")
+        messages3 = await markdown_history_agent.inquire(history_md_file=str(history_md_file))
+        with history_md_file.open("a", encoding="utf-8") as file:
+            file.write("=====")
+        messages4 = await markdown_history_agent.inquire(history_md_file=str(history_md_file))
+        with history_md_file.open("a", encoding="utf-8") as file:
+            file.write("x\n")
+        messages5 = await markdown_history_agent.inquire(history_md_file=str(history_md_file))
+
+    assert [(message.role, message.text) for message in messages1] == [("user", "Hello!"), ("assistant", "Hi")]
+    assert [(message.role, message.text) for message in messages2] == [
+        ("user", "Hello!"),
+        ("assistant", "Hi!"),
+        ("user", "Bye!"),
+    ]
+    assert messages2[0] is messages1[0]
+    assert [(message.role, message.text) for message in messages3] == [
+        ("user", "Hello!"),
+        ("assistant", "Hi!"),
+        ("user", "Bye!\n\nassistant"),
+    ]
+    assert [(message.role, message.text) for message in messages4] == [
+        ("user", "Hello!"),
+        ("assistant", "Hi!"),
+        ("user", "Bye!"),
+        ("assistant", ""),
+    ]
+    assert messages4[1] is messages2[1]
+    # `=====x` is not a setext underline anymore, so the last role heading disappears
+    assert [(message.role, message.text) for message in messages5] == [
+        ("user", "Hello!"),
+        ("assistant", "Hi!"),
+        ("user", "Bye!\n\nassistant\n=====x"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_in_memory_history_agent_max_messages() -> None:
+    """
+    Assert that `in_memory_history_agent` forgets the oldest messages when `max_messages` is exceeded.
+    """
+    message_list = []
+    history_agent = in_memory_history_agent.fork(message_list=message_list, max_messages=3)
+
+    async with MiniAgents():
+        await history_agent.inquire(["one", "two"])
+        messages = await history_agent.inquire(["three", "four"])
+
+    assert [str(message) for message in messages] == ["two", "three", "four"]
+    assert [str(message) for message in message_list] == ["two", "three", "four"]
@@ -0,0 +1,46 @@
+"""
+Test the common LLM classes and functions.
+"""
+
+import time
+from pathlib import Path
+
+import pytest
+
+from miniagents.ext.llm.llm_common import LLMResponseCache, RateLimiter
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_lets_bursts_through_and_then_paces() -> None:
+    """
+    Assert that RateLimiter lets through a minute's worth of tokens right away and makes the next request wait until
+    the bucket refills enough.
+    """
+    rate_limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=60000)  # 1000 tokens per second
+
+    start = time.monotonic()
+    await rate_limiter.await_capacity([{"role": "user", "content": "x" * 4000}], max_tokens=59000)
+    assert time.monotonic() - start < 0.05
+
+    await rate_limiter.await_capacity([], max_tokens=100)
+    assert time.monotonic() - start >= 0.09
+
+
+def test_llm_response_cache_round_trip(tmp_path: Path) -> None:
+    """
+    Assert that LLMResponseCache returns what was put into it, and that different requests get different keys.
+    """
+    response_cache = LLMResponseCache(tmp_path / "llm_cache")
+    key = response_cache.make_key(provider="openai", model="gpt-4o", messages=[{"role": "user", "content": "Hi"}])
+    other_key = response_cache.make_key(
+        provider="openai", model="gpt-4o", messages=[{"role": "user", "content": "Yo"}]
+    )
+
+    assert key != other_key
+    assert response_cache.get(key) is None
+
+    response_cache.put(key, "Hello!", {"role": "assistant", "usage": {"total_tokens": 5}})
+
+    assert response_cache.get(key) == ("Hello!", {"role": "assistant", "usage": {"total_tokens": 5}})
+    assert response_cache.get(other_key) is None
+    assert [path.name for path in (tmp_path / "llm_cache").iterdir()] == [f"{key}.json"]
@@ -0,0 +1,51 @@
+"""
+Test the MiniAgents context.
+"""
+
+import asyncio
+import sys
+import types
+
+import pytest
+
+from miniagents import MiniAgents, miniagent, InteractionContext
+
+
+@miniagent
+async def _echo_agent(ctx: InteractionContext) -> None:
+    ctx.reply(ctx.message_promises)
+
+
+async def _aecho_and_get_loop_module() -> tuple[list[str], str]:
+    replies = await _echo_agent.inquire(["hello", "world"])
+    return [str(reply) for reply in replies], type(asyncio.get_running_loop()).__module__
+
+
+def test_run_without_uvloop() -> None:
+    """
+    Assert that `MiniAgents.run()` runs the awaitable in a standard asyncio event loop when `use_uvloop` is False.
+    """
+    replies, loop_module = MiniAgents().run(_aecho_and_get_loop_module(), use_uvloop=False)
+
+    assert replies == ["hello", "world"]
+    assert loop_module.startswith("asyncio")
+
+
+@pytest.mark.parametrize(
+    "fake_uvloop",
+    [
+        None,  # uvloop is not installed (importing it raises ImportError)
+        types.ModuleType("uvloop"),  # uvloop is older than 0.18 (there is no `uvloop.run()`)
+    ],
+)
+def test_run_falls_back_to_asyncio(monkeypatch: pytest.MonkeyPatch, fake_uvloop) -> None:
+    """
+    Assert that `MiniAgents.run()` falls back to the standard asyncio event loop when uvloop is not installed or is
+    too old to have `uvloop.run()`.
+    """
+    monkeypatch.setitem(sys.modules, "uvloop", fake_uvloop)
+
+    replies, loop_module = MiniAgents().run(_aecho_and_get_loop_module())
+
+    assert replies == ["hello", "world"]
+    assert loop_module.startswith("asyncio")
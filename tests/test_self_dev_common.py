@@ -0,0 +1,87 @@
+"""
+Test the common code of the `self_dev` examples.
+"""
+
+import asyncio
+import os
+from pathlib import Path
+
+import pytest
+
+from examples.self_dev import self_dev_common
+from examples.self_dev.self_dev_common import _scan_repo_dir, full_repo_message, llm_semaphore
+
+
+def test_scan_repo_dir_does_not_follow_directory_symlinks(tmp_path: Path) -> None:
+    """
+    Assert that the repo scan doesn't descend into symlinked directories (neither into symlink loops nor into
+    directories outside the repo), but still includes symlinked files, like `Path.rglob()` does.
+    """
+    repo_dir = tmp_path / "repo"
+    (repo_dir / "sub").mkdir(parents=True)
+    (repo_dir / "a.py").write_text("a", encoding="utf-8")
+    (repo_dir / "sub" / "b.py").write_text("b", encoding="utf-8")
+    (repo_dir / ".git").mkdir()
+    (repo_dir / ".git" / "config").write_text("git", encoding="utf-8")
+    outside_dir = tmp_path / "outside"
+    outside_dir.mkdir()
+    (outside_dir / "c.py").write_text("c", encoding="utf-8")
+
+    os.symlink("..", repo_dir / "sub" / "loop")
+    os.symlink(outside_dir, repo_dir / "outside")
+    os.symlink(repo_dir / "a.py", repo_dir / "sub" / "a_link.py")
+
+    repo_files = []
+    _scan_repo_dir(repo_dir, "", (".",), repo_files)
+
+    assert sorted(file_posix_path for file_posix_path, _, _ in repo_files) == ["a.py", "sub/a_link.py", "sub/b.py"]
+
+
+def test_full_repo_message_scans_repo_once(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Assert that `full_repo_message()` builds the message from the same listing it makes the signature from (the repo
+    is scanned once per call) and that the message is reused until a file changes.
+    """
+    (tmp_path / "a.py").write_text("a", encoding="utf-8")
+    (tmp_path / "b.py").write_text("b", encoding="utf-8")
+
+    listing_calls = []
+
+    def _list_repo_files() -> list[tuple[str, Path, os.stat_result]]:
+        listing_calls.append(None)
+        repo_files = []
+        _scan_repo_dir(tmp_path, "", (".",), repo_files)
+        repo_files.sort(key=lambda file_tuple: file_tuple[0])
+        return repo_files
+
+    monkeypatch.setattr(self_dev_common, "_list_repo_files", _list_repo_files)
+    monkeypatch.setattr(self_dev_common, "_full_repo_message_cache", {})
+
+    message = full_repo_message()
+    assert [file_message.text for file_message in message.repo_files] == ["a", "b"]
+    assert len(listing_calls) == 1
+
+    assert full_repo_message() is message
+    assert len(listing_calls) == 2
+
+    (tmp_path / "b.py").write_text("bb", encoding="utf-8")
+    new_message = full_repo_message()
+    assert new_message is not message
+    assert [file_message.text for file_message in new_message.repo_files] == ["a", "bb"]
+    assert len(listing_calls) == 3
+
+
+def test_llm_semaphore_is_shared_within_event_loop() -> None:
+    """
+    Assert that all the callers in the same event loop get the same semaphore and that another event loop gets its own
+    one (a semaphore can't be shared between event loops in Python 3.9).
+    """
+
+    async def _get_llm_semaphores() -> tuple[asyncio.Semaphore, asyncio.Semaphore]:
+        return llm_semaphore(), llm_semaphore()
+
+    first_semaphore, second_semaphore = asyncio.run(_get_llm_semaphores())
+    assert first_semaphore is second_semaphore
+
+    another_loop_semaphore, _ = asyncio.run(_get_llm_semaphores())
+    assert another_loop_semaphore is not first_semaphore